@@ -1,7 +1,6 @@
 package com.example.qshare
 
 import okhttp3.MediaType.Companion.toMediaTypeOrNull
-import okhttp3.RequestBody.Companion.toRequestBody
 import android.content.ContentResolver
 import android.net.Uri
 import android.net.nsd.NsdManager
@@ -19,8 +18,10 @@ import kotlinx.coroutines.Dispatchers
 import kotlinx.coroutines.GlobalScope
 import kotlinx.coroutines.launch
 import okhttp3.*
+import okio.BufferedSink
 import okio.buffer
 import okio.sink
+import okio.source
 import org.json.JSONObject
 import java.io.InputStream
 import java.net.InetAddress
@@ -221,22 +222,23 @@ class MainActivity : ComponentActivity() {
 
         GlobalScope.launch(Dispatchers.IO) {
             try {
-                val stream: InputStream = resolver.openInputStream(uri)
-                    ?: throw Exception("Cannot open file")
-
-                val fileBytes = stream.readBytes()
-
-                val body = MultipartBody.Builder()
-                    .setType(MultipartBody.FORM)
-                    .addFormDataPart(
-                        "file",
-                        filename,
-                        fileBytes.toRequestBody("application/octet-stream".toMediaTypeOrNull())
-                    )
-                    .build()
+                // Stream the file as the raw request body (no multipart, no full read into RAM)
+                val length = queryLength(resolver, uri)
+                val body = object : RequestBody() {
+                    override fun contentType() = "application/octet-stream".toMediaTypeOrNull()
+
+                    override fun contentLength() = length
+
+                    override fun writeTo(sink: BufferedSink) {
+                        val stream: InputStream = resolver.openInputStream(uri)
+                            ?: throw Exception("Cannot open file")
+                        stream.source().use { sink.writeAll(it) }
+                    }
+                }
 
                 val req = Request.Builder()
-                    .url("$url/upload")
+                    .url("$url/upload_raw")
+                    .header("X-Filename", Uri.encode(filename))
                     .post(body)
                     .build()
 
@@ -262,6 +264,23 @@ class MainActivity : ComponentActivity() {
         }
     }
 
+    // Body length in bytes, or -1 if unknown (OkHttp then sends it chunked).
+    // The descriptor's length is authoritative; OpenableColumns.SIZE is only a hint
+    // and some providers report 0 or stale values there.
+    private fun queryLength(resolver: ContentResolver, uri: Uri): Long {
+        val fdLength = runCatching {
+            resolver.openAssetFileDescriptor(uri, "r")?.use { it.length }
+        }.getOrNull()
+        if (fdLength != null && fdLength >= 0) return fdLength
+
+        val cursor = resolver.query(uri, null, null, null, null) ?: return -1L
+        val size = cursor.use {
+            val sizeIndex = it.getColumnIndex(OpenableColumns.SIZE)
+            if (it.moveToFirst() && sizeIndex >= 0 && !it.isNull(sizeIndex)) it.getLong(sizeIndex) else null
+        }
+        return if (size != null && size > 0) size else -1L
+    }
+
     private fun toast(msg: String) {
         Toast.makeText(this, msg, Toast.LENGTH_SHORT).show()
     }
@@ -1,27 +1,64 @@
+import atexit
+import base64
+import functools
+import ipaddress
+import itertools
+import logging
 import os
+import queue
+import re
+import shutil
 import socket
+import stat
+import sys
 import threading
 import time
 import subprocess
-
-from flask import Flask, jsonify, request, send_from_directory, abort
+from urllib.parse import quote, unquote
+
+try:
+    import resource  # Unix only
+except ImportError:
+    resource = None
+
+import ifaddr
+import orjson
+from flask import Flask, Response, jsonify, request, abort, send_file
+from waitress.buffers import ReadOnlyFileBasedBuffer
+from waitress.channel import HTTPChannel
+from waitress.server import create_server
+from werkzeug.exceptions import RequestedRangeNotSatisfiable
 from werkzeug.utils import secure_filename
 from zeroconf import IPVersion, ServiceInfo, Zeroconf
 
 APP_NAME = "QShare"
 SERVICE_TYPE = "_qshare._tcp.local."
 SERVICE_NAME = f"{APP_NAME}._qshare._tcp.local."
+SERVICE_SERVER = f"{APP_NAME}.local."
+MDNS_PROPERTIES = {
+    b"path": b"/",
+    b"api": b"/api/list",
+    b"app": APP_NAME.encode("utf-8"),
+}
 
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 SHARED_DIR = os.path.join(BASE_DIR, "shared")
 os.makedirs(SHARED_DIR, exist_ok=True)
+# Pre-encoded prefix: hot-path syscalls take bytes paths, skipping join + per-call str->fs encoding
+SHARED_DIR_B = os.fsencode(SHARED_DIR) + os.fsencode(os.sep)
 
 app = Flask(__name__)
 app.config["MAX_CONTENT_LENGTH"] = 5 * 1024 * 1024 * 1024  # 5GB
 
+COPY_CHUNK = 1024 * 1024          # 1MB user-space copy buffer
+SENDFILE_CHUNK = 8 * 1024 * 1024  # 8MB per os.sendfile() call
+# file -> file sendfile(2) is Linux-only; macOS/BSD only accept a socket as out_fd
+HAS_SENDFILE = sys.platform.startswith("linux") and hasattr(os, "sendfile")
+
 
 # -------------------- helpers --------------------
 
+@functools.lru_cache(maxsize=1)
 def is_wsl() -> bool:
     try:
         with open("/proc/version", "r", encoding="utf-8") as f:
@@ -31,13 +68,121 @@ def is_wsl() -> bool:
         return False
 
 
+# Evaluated once at import; every WSL-only helper returns immediately when False
+IS_WSL = is_wsl()
+
+
 def run_cmd(cmd: list[str]) -> tuple[int, str, str]:
     p = subprocess.run(cmd, capture_output=True, text=True)
     return p.returncode, (p.stdout or "").strip(), (p.stderr or "").strip()
 
 
-def get_wsl_ip() -> str:
-    # IP of the WSL distro (usually 172.17.x.x or similar)
+# -------------------- PowerShell (WSL) --------------------
+
+# One long-lived powershell.exe reading commands from stdin, so N calls pay the
+# interpreter cold start (0.5-2s on WSL) once. Falls back to one-shot processes
+# when no session was started.
+_PS: subprocess.Popen | None = None
+_PS_LOCK = threading.Lock()
+_PS_END = "__END__"
+_PS_ERR = "__ERR__"
+_PS_LINES: queue.Queue = queue.Queue()
+PS_TIMEOUT = 30.0  # per script; Get-NetIPAddress can take seconds on a cold session
+
+
+def _pump_powershell_stdout(ps: subprocess.Popen, lines: queue.Queue) -> None:
+    # Reader thread, so ps_run() can wait with a deadline instead of a blocking readline()
+    for line in ps.stdout:
+        lines.put(line)
+    lines.put(None)  # EOF
+
+
+def start_powershell_session() -> None:
+    global _PS, _PS_LINES
+    if not IS_WSL or _PS is not None:
+        return
+    try:
+        _PS = subprocess.Popen(
+            ["powershell.exe", "-NoProfile", "-Command", "-"],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            # Host-level stderr (e.g. #< CLIXML progress records) is never data;
+            # script errors come back on stdout tagged with _PS_ERR instead
+            stderr=subprocess.DEVNULL,
+            text=True,
+            bufsize=1,
+        )
+    except OSError:
+        _PS = None
+        return
+    _PS_LINES = queue.Queue()
+    threading.Thread(target=_pump_powershell_stdout, args=(_PS, _PS_LINES), daemon=True).start()
+    atexit.register(stop_powershell_session)
+
+
+def stop_powershell_session() -> None:
+    global _PS
+    if _PS is None:
+        return
+    try:
+        _PS.stdin.close()
+        _PS.wait(timeout=5)
+    except Exception:
+        _PS.kill()
+    _PS = None
+
+
+def ps_run(script: str) -> tuple[int, str, str]:
+    """
+    Run a PowerShell script, return ($LASTEXITCODE, stdout, stderr) like run_cmd().
+    Scripts report failure by setting $global:LASTEXITCODE (never `exit`, which
+    would end the shared session).
+    """
+    global _PS
+    if not IS_WSL:
+        return 1, "", ""
+    with _PS_LOCK:
+        if _PS is None or _PS.poll() is not None:
+            return run_cmd(["powershell.exe", "-NoProfile", "-Command", f"{script}\nexit $LASTEXITCODE"])
+
+        # -Command - executes stdin line by line; ship the script as one base64 line
+        b64 = base64.b64encode(script.encode("utf-8")).decode("ascii")
+        # try/finally: the sentinel is printed even if the script throws
+        _PS.stdin.write(
+            "$global:LASTEXITCODE = 0; try { "
+            f"Invoke-Expression ([Text.Encoding]::UTF8.GetString([Convert]::FromBase64String('{b64}'))) 2>&1 | "
+            "ForEach-Object { if ($_ -is [Management.Automation.ErrorRecord]) "
+            f"{{ '{_PS_ERR}' + ($_.ToString() -replace '\\s+', ' ') }} else {{ $_ }} }} | Out-String -Stream "
+            f"}} catch {{ '{_PS_ERR}' + ($_.ToString() -replace '\\s+', ' '); $global:LASTEXITCODE = 1 "
+            f"}} finally {{ '{_PS_END}' + [int]$LASTEXITCODE }}\n"
+        )
+        _PS.stdin.flush()
+
+        out, err = [], []
+        deadline = time.monotonic() + PS_TIMEOUT
+        while True:
+            try:
+                line = _PS_LINES.get(timeout=max(0.0, deadline - time.monotonic()))
+            except queue.Empty:
+                # Stalled session: drop it and redo this script as a one-shot process
+                _PS.kill()
+                _PS.wait()
+                _PS = None
+                return run_cmd(["powershell.exe", "-NoProfile", "-Command", f"{script}\nexit $LASTEXITCODE"])
+            if line is None:  # session died mid-command
+                return 1, "".join(out).strip(), "".join(err).strip()
+            if line.startswith(_PS_END):
+                code = int(line[len(_PS_END):].strip() or 0)
+                return code, "".join(out).strip(), "".join(err).strip()
+            if line.startswith(_PS_ERR):
+                err.append(line[len(_PS_ERR):])
+            else:
+                out.append(line)
+
+
+@functools.lru_cache(maxsize=1)
+def get_outbound_ip() -> str:
+    # Source address the kernel picks for outbound traffic (UDP connect sends nothing)
     s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
     try:
         s.connect(("8.8.8.8", 80))
@@ -46,19 +191,61 @@ def get_wsl_ip() -> str:
         s.close()
 
 
+def get_wsl_ip() -> str:
+    # IP of the WSL distro (usually 172.17.x.x or similar)
+    return get_outbound_ip()
+
+
+IPCONFIG_EXE = "/mnt/c/Windows/System32/ipconfig.exe"
+_IPV4_LINE = re.compile(r"IPv4 Address[^:]*:\s*([\d.]+)")
+
+
+def _parse_ipconfig_wifi_ip(out: str) -> str | None:
+    # Adapter headers start at column 0, their details are indented below
+    for block in re.split(r"\r?\n(?=\S)", out):
+        header, _, body = block.partition("\n")
+        if "Wi-Fi" not in header:
+            continue
+        m = _IPV4_LINE.search(body)
+        if m and not m.group(1).startswith("169.254."):
+            return m.group(1)
+    return None
+
+
+@functools.lru_cache(maxsize=1)
 def get_windows_wifi_ip() -> str | None:
     """
     From WSL: ask Windows for the Wi-Fi IPv4.
+    ipconfig.exe starts far faster than powershell.exe; PowerShell is the fallback
+    (e.g. localized ipconfig output, C: not mounted at /mnt/c).
     """
+    if not IS_WSL:
+        return None
+    try:
+        code, out, _ = run_cmd([IPCONFIG_EXE])
+    except (OSError, ValueError):  # missing binary / undecodable output
+        code, out = 1, ""
+    if code == 0:
+        ip = _parse_ipconfig_wifi_ip(out)
+        if ip:
+            return ip
+
     ps = r"""
 $ip = Get-NetIPAddress -AddressFamily IPv4 |
   Where-Object { $_.InterfaceAlias -match 'Wi-Fi' -and $_.IPAddress -notlike '169.254.*' -and $_.IPAddress -ne '127.0.0.1' } |
   Select-Object -ExpandProperty IPAddress -First 1
 $ip
 """
-    code, out, _ = run_cmd(["powershell.exe", "-NoProfile", "-Command", ps])
-    if code == 0 and out:
-        return out.strip()
+    code, out, _ = ps_run(ps)
+    if code != 0:
+        return None
+    # Only a line that really is an IPv4 address; anything else (warnings, progress
+    # noise) would end up in netsh listenaddress= and inet_aton()
+    for line in out.splitlines():
+        try:
+            return str(ipaddress.IPv4Address(line.strip()))
+        except ValueError:
+            continue
     return None
 
 
@@ -66,12 +253,20 @@ def get_native_ip() -> str:
     """
     For native Linux: choose interface used for outbound routing.
     """
-    s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-    try:
-        s.connect(("8.8.8.8", 80))
-        return s.getsockname()[0]
-    finally:
-        s.close()
+    return get_outbound_ip()
+
+
+def get_lan_ipv4s(primary: str) -> list[str]:
+    """
+    Every usable IPv4 on this host, primary first. On multi-homed hosts
+    (Wi-Fi + Ethernet, ...) the phone can use whichever address it can reach.
+    """
+    addrs = [primary]
+    for adapter in ifaddr.get_adapters():
+        for ip in adapter.ips:
+            if isinstance(ip.ip, str) and not ip.ip.startswith(("127.", "169.254.")) and ip.ip not in addrs:
+                addrs.append(ip.ip)
+    return addrs
 
 
 # -------------------- Windows port forwarding (WSL) --------------------
@@ -81,68 +276,265 @@ def ensure_windows_portproxy(listen_ip: str, listen_port: int, wsl_ip: str, wsl_
     On WSL: forward Windows listen_ip:listen_port -> wsl_ip:wsl_port.
     Requires elevated privileges on Windows; if not admin, we print commands.
     """
+    if not IS_WSL:
+        return
     del_cmd = f'netsh interface portproxy delete v4tov4 listenport={listen_port} listenaddress={listen_ip}'
     add_cmd = f'netsh interface portproxy add v4tov4 listenport={listen_port} listenaddress={listen_ip} connectport={wsl_port} connectaddress={wsl_ip}'
     fw_cmd  = f'netsh advfirewall firewall add rule name="QShare {listen_port}" dir=in action=allow protocol=TCP localport={listen_port}'
 
-    # Try to run (may fail if not admin)
-    subprocess.run(["powershell.exe", "-NoProfile", "-Command", del_cmd], capture_output=True, text=True)
-    add = subprocess.run(["powershell.exe", "-NoProfile", "-Command", add_cmd], capture_output=True, text=True)
-    fw  = subprocess.run(["powershell.exe", "-NoProfile", "-Command", fw_cmd], capture_output=True, text=True)
+    # Try to run (may fail if not admin). One PowerShell round-trip for all three commands.
+    script = "; ".join([
+        f"{del_cmd} | Out-Null",
+        f"{add_cmd}; $add = $LASTEXITCODE",
+        f"{fw_cmd}; $fw = $LASTEXITCODE",
+        "if ($add -ne 0 -or $fw -ne 0) { $global:LASTEXITCODE = 1 }",
+    ])
+    code, out, err = ps_run(script)
 
-    if add.returncode != 0 or fw.returncode != 0:
+    if code != 0:
         print("\n[QShare] Detected WSL. Windows port forwarding is required so your phone can reach the server.")
         print("[QShare] Could not configure portproxy/firewall automatically (needs Admin).")
         print("\nRun this ONE TIME in an *elevated* PowerShell (Run as Administrator):\n")
         print(f"  {del_cmd}")
         print(f"  {add_cmd}")
         print(f"  {fw_cmd}\n")
-        if add.stderr:
-            print("[QShare] portproxy error:", add.stderr.strip())
-        if fw.stderr:
-            print("[QShare] firewall error:", fw.stderr.strip())
+        if err or out:  # netsh reports its own failures on stdout
+            print("[QShare] portproxy/firewall error:", err or out)
     else:
         print(f"\n[QShare] Windows portproxy OK: {listen_ip}:{listen_port} -> {wsl_ip}:{wsl_port}")
 
 
+# -------------------- upload storage --------------------
+
+# Names that secure_filename() would return unchanged: only [A-Za-z0-9._-] and no
+# leading/trailing "." or "_". Windows still goes through it for the device-name check.
+_SAFE_ASCII = re.compile(r"[A-Za-z0-9._-]{1,255}")
+
+
+def safe_upload_name(raw: str) -> str:
+    if os.name != "nt" and _SAFE_ASCII.fullmatch(raw) and raw == raw.strip("._"):
+        return raw
+    return secure_filename(raw)
+
+
+def create_upload_file(filename: str) -> tuple[str, int]:
+    """
+    Create a new file in SHARED_DIR: "name.ext", then "name (1).ext", "name (2).ext", ...
+    O_EXCL makes check-and-create one atomic syscall, so concurrent uploads of the
+    same name can't clobber each other. Returns (saved name, open write fd).
+    """
+    base, ext = os.path.splitext(filename)
+    for i in itertools.count():
+        candidate = filename if i == 0 else f"{base} ({i}){ext}"
+        try:
+            fd = os.open(SHARED_DIR_B + os.fsencode(candidate), os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o644)
+        except FileExistsError:
+            continue
+        return candidate, fd
+
+
+def save_stream(src, dst: int) -> None:
+    """
+    Write an uploaded stream to the fd dst (closed on return).
+    Disk-spooled uploads are copied with os.sendfile (bytes stay in the kernel);
+    in-memory uploads (small SpooledTemporaryFile parts, BytesIO), non-Linux hosts
+    and filesystems without sendfile support get a 1MB shutil.copyfileobj loop
+    (4x+ faster than FileStorage.save's 16KB).
+    """
+    src.seek(0)
+    src_fd = None
+    # SpooledTemporaryFile.fileno() forces a rollover to disk, so only ask for an fd
+    # once werkzeug has already spooled the part to a real file
+    if getattr(src, "_rolled", True):
+        try:
+            src_fd = src.fileno()
+        except (AttributeError, OSError):  # io.UnsupportedOperation for BytesIO
+            src_fd = None
+
+    try:
+        if HAS_SENDFILE and src_fd is not None:
+            offset = 0
+            try:
+                while True:
+                    sent = os.sendfile(dst, src_fd, offset, SENDFILE_CHUNK)
+                    if sent == 0:
+                        return
+                    offset += sent
+            except OSError:
+                # Some filesystems (e.g. drvfs/9p under WSL) reject sendfile;
+                # dst is positioned at offset, so finish with the copy loop
+                src.seek(offset)
+        with open(dst, "wb", closefd=False) as dst_file:
+            shutil.copyfileobj(src, dst_file, length=COPY_CHUNK)
+    finally:
+        os.close(dst)
+
+
 # -------------------- file listing & API --------------------
 
+# Listing cache, keyed on SHARED_DIR's mtime (changes on create/delete/rename).
+# Writes into an existing file (e.g. the host copying a big file into shared/) don't
+# touch the dir mtime, so a hit is also only trusted for LIST_CACHE_TTL seconds:
+# sizes/mtimes shown by /api/list are at most that stale. Uploads additionally call
+# invalidate_list_cache() once the file is complete.
+LIST_CACHE_TTL = 2.0
+_LIST_CACHE = {"dir_mtime": -1, "built": 0.0, "data": []}
+_LIST_LOCK = threading.Lock()
+
+
+def invalidate_list_cache() -> None:
+    with _LIST_LOCK:
+        _LIST_CACHE["dir_mtime"] = -1
+
+
 def list_shared_files():
+    dm = os.stat(SHARED_DIR_B).st_mtime_ns
+    now = time.monotonic()
+    with _LIST_LOCK:
+        if dm == _LIST_CACHE["dir_mtime"] and now - _LIST_CACHE["built"] < LIST_CACHE_TTL:
+            return _LIST_CACHE["data"]
+        items = _scan_shared_files()
+        _LIST_CACHE["dir_mtime"] = dm
+        _LIST_CACHE["built"] = now
+        _LIST_CACHE["data"] = items
+        return items
+
+
+def _scan_shared_files():
     items = []
-    for name in os.listdir(SHARED_DIR):
-        path = os.path.join(SHARED_DIR, name)
-        if os.path.isfile(path):
-            st = os.stat(path)
-            items.append({
-                "name": name,
-                "size": st.st_size,
-                "mtime": int(st.st_mtime),
-            })
+    # DirEntry.is_file() uses the d_type from the directory read, no extra stat
+    with os.scandir(SHARED_DIR) as it:
+        for e in it:
+            if e.is_file():
+                st = e.stat()
+                items.append({
+                    "name": e.name,
+                    "size": st.st_size,
+                    "mtime": int(st.st_mtime),
+                })
     items.sort(key=lambda x: x["mtime"], reverse=True)
     return items
 
 
+def _json(obj) -> Response:
+    # orjson encodes straight to bytes; much cheaper than jsonify for the polled endpoints
+    return Response(orjson.dumps(obj), mimetype="application/json")
+
+
 @app.get("/api/ping")
 def ping():
-    return jsonify({"ok": True, "name": APP_NAME, "time": int(time.time())})
+    return _json({"ok": True, "name": APP_NAME, "time": int(time.time())})
 
 
 @app.get("/api/list")
 def api_list():
-    return jsonify({
+    return _json({
         "ok": True,
         "files": list_shared_files(),
         "serverTime": int(time.time())
     })
 
 
+# -------------------- proxy offload (X-Accel-Redirect / X-Sendfile) --------------------
+
+# Off unless the operator opts in: "nginx" (X-Accel-Redirect) or "apache" (X-Sendfile).
+# The server listens on 0.0.0.0, so the request header alone can't be trusted:
+# any LAN client could send it (and, for apache, read back the absolute path).
+PROXY_SENDFILE = os.environ.get("QSHARE_PROXY_SENDFILE", "").strip().lower()
+ACCEL_PREFIX = os.environ.get("QSHARE_ACCEL_PREFIX", "/protected/")
+
+
+def offload_response(safe_name: str) -> Response | None:
+    """
+    Empty response telling the reverse proxy which file to send, or None if the
+    file has to be served directly.
+    Needs both QSHARE_PROXY_SENDFILE=nginx|apache on the server and the proxy
+    setting X-QShare-Use-Sendfile on the upstream request:
+
+      nginx:
+        location / {
+            proxy_pass http://127.0.0.1:54837;
+            proxy_set_header X-QShare-Use-Sendfile 1;
+        }
+        location /protected/ {
+            internal;
+            alias /path/to/QShare/shared/;
+            sendfile on;
+            tcp_nopush on;
+        }
+
+      Apache (mod_xsendfile):
+        RequestHeader set X-QShare-Use-Sendfile 1
+        XSendFile On
+        XSendFilePath /path/to/QShare/shared
+    """
+    resp = Response(b"", mimetype="application/octet-stream")
+    try:
+        safe_name.encode("ascii")
+        disposition = {"filename": safe_name}
+    except UnicodeEncodeError:
+        # RFC 6266: ASCII fallback + UTF-8 filename*
+        disposition = {
+            "filename": secure_filename(safe_name) or "download",
+            "filename*": f"UTF-8''{quote(safe_name)}",
+        }
+    resp.headers.set("Content-Disposition", "attachment", **disposition)
+    if PROXY_SENDFILE == "apache":
+        file_path = os.path.join(SHARED_DIR, safe_name)
+        try:
+            file_path.encode("latin-1")  # raw path in a header; can't carry anything else
+        except UnicodeEncodeError:
+            return None
+        resp.headers["X-Sendfile"] = file_path
+    else:
+        resp.headers["X-Accel-Redirect"] = ACCEL_PREFIX + quote(safe_name)
+    return resp
+
+
 @app.get("/download/<path:filename>")
 def download(filename):
     safe_name = os.path.basename(filename)
-    file_path = os.path.join(SHARED_DIR, safe_name)
-    if not os.path.isfile(file_path):
+    file_path = SHARED_DIR_B + os.fsencode(safe_name)
+    try:
+        if not stat.S_ISREG(os.stat(file_path).st_mode):
+            abort(404)
+        fh = open(file_path, "rb")
+    except (OSError, ValueError):  # missing, or an embedded NUL in the name
         abort(404)
-    return send_from_directory(SHARED_DIR, safe_name, as_attachment=True)
+    # Size and validators from the open file, so a truncate between stat and open can't skew them
+    st = os.fstat(fh.fileno())
+    etag = f"{st.st_size:x}-{st.st_mtime_ns:x}"
+
+    resp = None
+    if PROXY_SENDFILE in ("nginx", "apache") and request.environ.get("HTTP_X_QSHARE_USE_SENDFILE"):
+        # Behind nginx/Apache: the proxy streams the file itself, no bytes through Python
+        resp = offload_response(safe_name)
+    if resp is not None:
+        fh.close()
+        resp.set_etag(etag)
+        resp.last_modified = st.st_mtime
+        complete_length = None  # the proxy answers Range itself
+    else:
+        # send_file keeps mimetype guessing and an RFC 6266 Content-Disposition, and
+        # hands the open file to the server's wsgi.file_wrapper
+        resp = send_file(
+            fh,
+            as_attachment=True,
+            download_name=safe_name,
+            etag=etag,
+            last_modified=st.st_mtime,
+            conditional=False,
+        )
+        resp.content_length = complete_length = st.st_size
+    resp.headers["Cache-Control"] = "private, max-age=0, must-revalidate"
+
+    # 304 on If-None-Match (weak comparison, RFC 7232) / If-Modified-Since, 206 on Range
+    try:
+        return resp.make_conditional(request, accept_ranges=complete_length is not None,
+                                     complete_length=complete_length)
+    except RequestedRangeNotSatisfiable:
+        fh.close()
+        raise
 
 
 @app.post("/upload")
@@ -153,56 +545,125 @@ def upload():
     if not f.filename:
         return jsonify({"ok": False, "error": "Empty filename"}), 400
 
-    filename = secure_filename(f.filename)
+    filename = safe_upload_name(f.filename)
     if not filename:
         return jsonify({"ok": False, "error": "Invalid filename"}), 400
 
-    out_path = os.path.join(SHARED_DIR, filename)
+    filename, fd = create_upload_file(filename)
+    save_stream(f.stream, fd)
+    invalidate_list_cache()
+    return jsonify({"ok": True, "savedAs": filename})
+
+
+@app.post("/upload_raw")
+def upload_raw():
+    """
+    Raw-body upload: the request body is the file, the name comes from X-Filename
+    (percent-encoded by the client). Skips multipart parsing and werkzeug's temp spool.
+    """
+    raw_name = unquote(request.headers.get("X-Filename", ""))
+    if not raw_name:
+        return jsonify({"ok": False, "error": "Empty filename"}), 400
+
+    filename = safe_upload_name(raw_name)
+    if not filename:
+        return jsonify({"ok": False, "error": "Invalid filename"}), 400
 
-    if os.path.exists(out_path):
-        base, ext = os.path.splitext(filename)
-        i = 1
+    filename, fd = create_upload_file(filename)
+    with open(fd, "wb", buffering=0) as dst:
         while True:
-            candidate = f"{base} ({i}){ext}"
-            out_path = os.path.join(SHARED_DIR, candidate)
-            if not os.path.exists(out_path):
-                filename = candidate
+            chunk = request.stream.read(COPY_CHUNK)
+            if not chunk:
                 break
-            i += 1
-
-    f.save(out_path)
+            dst.write(chunk)
+    invalidate_list_cache()
     return jsonify({"ok": True, "savedAs": filename})
 
 
+# -------------------- waitress channel (TCP_CORK) --------------------
+
+# Linux TCP_CORK / BSD+macOS TCP_NOPUSH: while a file body is being streamed, only
+# full segments go out; uncorking flushes the tail. waitress already sets TCP_NODELAY.
+TCP_CORK = getattr(socket, "TCP_CORK", None) or getattr(socket, "TCP_NOPUSH", None)
+
+
+class CorkingChannel(HTTPChannel):
+    """
+    Corks the socket while a wsgi.file_wrapper body (a download) is queued and
+    uncorks once the output buffers are drained, so small JSON replies are never delayed.
+    """
+    corked = False
+
+    def _set_cork(self, on: bool) -> None:
+        try:
+            self.socket.setsockopt(socket.IPPROTO_TCP, TCP_CORK, int(on))
+            self.corked = on
+        except OSError:  # socket already closed
+            pass
+
+    def _flush_some(self, do_close=True):
+        if not self.corked and any(isinstance(b, ReadOnlyFileBasedBuffer) for b in self.outbufs):
+            self._set_cork(True)
+        try:
+            return super()._flush_some(do_close=do_close)
+        finally:
+            if self.corked and not self.total_outbufs_len:
+                self._set_cork(False)
+
+
+# Each connection can hold up to 3 fds: its socket, an open download and waitress's
+# request-body spool file. Keep accept() + open() clear of EMFILE, with headroom for
+# the listener, trigger pipe, zeroconf sockets and the PowerShell session.
+FDS_PER_CONNECTION = 3
+FD_RESERVE = 64
+
+
+def connection_limit(wanted: int = 1000) -> int:
+    """
+    Raise the soft RLIMIT_NOFILE toward what `wanted` connections need (capped by the
+    hard limit) and return how many connections actually fit under it.
+    """
+    if resource is None:  # Windows: select() is capped at 512 sockets anyway
+        return min(wanted, 100)
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    need = wanted * FDS_PER_CONNECTION + FD_RESERVE
+    if soft != resource.RLIM_INFINITY and soft < need:
+        target = need if hard == resource.RLIM_INFINITY else min(need, hard)
+        try:
+            resource.setrlimit(resource.RLIMIT_NOFILE, (target, hard))
+            soft = target
+        except (ValueError, OSError):  # e.g. macOS caps below the hard limit
+            pass
+    if soft == resource.RLIM_INFINITY:
+        return wanted
+    return max(1, min(wanted, (soft - FD_RESERVE) // FDS_PER_CONNECTION))
+
+
 # -------------------- mDNS registration --------------------
 
-def register_mdns_service(advertise_ip: str, port: int):
+_SHUTDOWN = threading.Event()
+
+
+def register_mdns_service(advertise_ips: list[str], port: int):
     zeroconf = Zeroconf(ip_version=IPVersion.V4Only)
     info = ServiceInfo(
         type_=SERVICE_TYPE,
         name=SERVICE_NAME,
-        addresses=[socket.inet_aton(advertise_ip)],
+        addresses=[socket.inet_aton(ip) for ip in advertise_ips],
         port=port,
-        properties={
-            b"path": b"/",
-            b"api": b"/api/list",
-            b"app": APP_NAME.encode("utf-8"),
-        },
-        server=f"{APP_NAME}.local.",
+        properties=MDNS_PROPERTIES,
+        server=SERVICE_SERVER,
     )
 
     zeroconf.register_service(info)
 
     print(f"\n[{APP_NAME}] mDNS advertised as: {SERVICE_NAME}")
-    print(f"[{APP_NAME}] Advertised IP: {advertise_ip}")
-    print(f"[{APP_NAME}] Open URL: http://{advertise_ip}:{port}")
+    print(f"[{APP_NAME}] Advertised IPs: {', '.join(advertise_ips)}")
+    print(f"[{APP_NAME}] Open URL: http://{advertise_ips[0]}:{port}")
     print(f"[{APP_NAME}] Shared folder: {SHARED_DIR}\n")
 
     try:
-        while True:
-            time.sleep(1)
-    except KeyboardInterrupt:
-        pass
+        _SHUTDOWN.wait()  # blocks in the kernel, no periodic wakeups
     finally:
         try:
             zeroconf.unregister_service(info)
@@ -216,8 +677,11 @@ def run():
 
     # ✅ Always respect explicit override first
     advertise_ip = os.environ.get("QSHARE_IP", "").strip()
+    advertise_ips = [advertise_ip]
 
-    if is_wsl():
+    if IS_WSL:
+        # Spawn now so PowerShell warms up while ipconfig.exe runs
+        start_powershell_session()
         wsl_ip = get_wsl_ip()
 
         if not advertise_ip:
@@ -229,15 +693,43 @@ def run():
         # (If advertise_ip == wsl_ip, portproxy isn't useful for the phone anyway)
         if advertise_ip != wsl_ip:
             ensure_windows_portproxy(advertise_ip, port, wsl_ip, port)
+        # Only needed for the startup probes above; don't keep powershell.exe idling
+        stop_powershell_session()
+
+        # WSL2 interfaces sit behind NAT; only the chosen address is reachable
+        advertise_ips = [advertise_ip]
 
     else:
         if not advertise_ip:
-            advertise_ip = get_native_ip()
+            advertise_ips = get_lan_ipv4s(get_native_ip())
 
-    t = threading.Thread(target=register_mdns_service, args=(advertise_ip, port), daemon=True)
+    t = threading.Thread(target=register_mdns_service, args=(advertise_ips, port), daemon=True)
     t.start()
 
-    app.run(host="0.0.0.0", port=port, debug=False, threaded=True)
+    # waitress multiplexes every connection on one asyncore loop and only hands
+    # complete requests to the worker threads, so idle polling clients cost no thread
+    server = create_server(
+        app,
+        host="0.0.0.0",
+        port=port,
+        threads=8,
+        asyncore_use_poll=True,    # poll(): no FD_SETSIZE cap, no fd_set rebuild per wakeup
+        connection_limit=connection_limit(1000),  # fits under RLIMIT_NOFILE, see above
+        channel_timeout=600,       # large transfers over slow Wi-Fi
+        # waitress defaults to 1GB; it also answers an oversized Content-Length with
+        # 413 while parsing headers, before the request ever reaches Flask
+        max_request_body_size=app.config["MAX_CONTENT_LENGTH"],
+    )
+    if TCP_CORK is not None:
+        server.channel_class = CorkingChannel
+    logging.basicConfig()  # waitress.serve() does this; create_server() doesn't
+    server.print_listen("Serving on http://{}:{}")
+    try:
+        server.run()  # returns on Ctrl+C
+    finally:
+        # let the mDNS thread unregister the service before the process exits
+        _SHUTDOWN.set()
+        t.join(timeout=5)
 
 
 if __name__ == "__main__":